@@ -1,18 +1,182 @@
 import os
+import csv
+import functools
+import hashlib
+import math
+import re
+import shutil
+import subprocess
+import threading
+import time
+import zipfile
 import streamlit as st
 from groq import Groq
-import pdfplumber
-from pptx import Presentation
-import pandas as pd
-from docx import Document
-import time
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from itertools import groupby
+from operator import itemgetter
+from queue import Queue
+from xml.sax.saxutils import escape
+
+# Prompt context budget in tokens, estimated at CHARS_PER_TOKEN characters
+# per token. gemma2-9b-it has an 8k-token window that the instructions and
+# the generated paper share with the document context.
+MAX_CONTEXT_TOKENS = 1000
+CHARS_PER_TOKEN = 4
+
+# Size of the passages ranked against the focus topic
+CONTEXT_WINDOW_CHARS = 1000
+
+# Most text kept from one upload. Far above the prompt budget, so topic
+# ranking still sees most of a long document, but parsing stops early on
+# very large files instead of holding all of their text in memory.
+MAX_EXTRACT_CHARS = 200_000
+
+_WORD_RE = re.compile(r"\w+")
+
+# Common words that say nothing about a topic; they and words shorter than
+# three letters are not used as topic keywords
+_STOPWORDS = frozenset("""
+about above after again against all also and any are because been before being below between both but can
+does doing down during each few for from further had has have having her here hers him his how into its
+more most not now off once only other our ours out over own same she should some such than that the their
+theirs them then there these they this those through too under until very was were what when where which
+while who whom why will with you your yours
+""".split())
+
+# Line kinds in a generated paper, named after their PDF styles: section
+# headers, questions, MCQ options and other content
+_LINE_RE = re.compile(r"^(?:###\s*(?P<header>.*?)[\s#]*|(?P<question>Q.*)|(?P<option>[A-D]\).*)|(?P<body>.+))$")
+
+# WordprocessingML namespace, as used in a docx's word/document.xml
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Text for the non-w:t run content a docx paragraph can hold
+_DOCX_RUN_BREAKS = {_W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n"}
+
+# Groq model settings; all are part of the response cache key
+MODEL = "gemma2-9b-it"
+MODEL_CONTEXT_TOKENS = 8192  # Shared by the prompt and the reply
+TEMPERATURE = 0.3  # Enough variety to avoid repetition, but mostly deterministic
+TOP_P = 0.9
+
+# Generated questions are reused for identical requests for this long
+RESPONSE_CACHE_TTL = 3600
+# Most near-duplicate responses the semantic cache keeps per session
+SEMANTIC_CACHE_MAX_ENTRIES = 128
+
+# Start of the text generate_questions and generate_paper return when the
+# Groq request fails
+GENERATION_ERROR = "Error generating questions"
+
+SYSTEM_PROMPT = "You are a precise, academic exam question generator. Dont give the raw heading and data and give point to point data only in a good format and alignment"
+
+# Section heading for each question type when the whole paper is requested
+# at once; these are also the headings shown on the page and in the PDF
+PAPER_SECTION_HEADINGS = {
+    "multiple choice questions": "Multiple Choice Questions",
+    "short questions": "Short Questions",
+    "long questions": "Long Questions",
+}
+
+# Output budget per question of each type. Replies are capped at
+# num_questions times this, since every extra token is serial decode time
+TOKENS_PER_QUESTION = {
+    "multiple choice questions": 120,
+    "short questions": 80,
+    "long questions": 220,
+}
+# Extra allowance per section of a combined paper for its heading
+PAPER_SECTION_TOKENS = 16
+
+# Prompt templates. Static instructions come first and request-specific
+# values last, so repeated requests share the longest possible prompt prefix
+# (which is what provider-side prompt caching keys on).
+QUESTION_PROMPTS = {
+    "multiple choice questions": ("MULTIPLE CHOICE QUESTIONS (MCQs)", """STRICT MCQ FORMATTING REQUIREMENTS:
+- Generate the requested number of UNIQUE Multiple Choice Questions
+- Each question MUST have EXACTLY 4 options
+
+MCQ FORMAT:
+Q[number]. [Precise, knowledge-testing question]
+
+Options (EXACTLY 4, precisely formatted and new line after each option):
+A) [Option 1 then start a new line]
+B) [Option 2 then start a new line]
+C) [Option 3 then start a new line]
+D) [Option 4 then start a new line]
+
+CRITICAL GUIDELINES:
+- Derive questions ONLY from provided content
+- Ensure NO overlap between questions
+- Options must be academically credible
+- CORRECT answer must be unambiguously right
+- Maintain academic language
+- Complexity matches specified difficulty level
+"""),
+    "short questions": ("SHORT ANSWER QUESTIONS", """STRICT SHORT QUESTION FORMATTING REQUIREMENTS:
+- Generate the requested number of UNIQUE Short Answer Questions
+- Each question requires a focused, concise response (2-3 sentences)
+
+SHORT QUESTION FORMAT:
+Q[number]. [Precise, concept-testing question requiring brief, specific answer]
+
+CRITICAL GUIDELINES:
+- Questions must be answerable using ONLY the provided content
+- Focus on key concepts, definitions, explanations
+- Avoid yes/no questions
+- Ensure questions test understanding, not mere recall
+- Each question should require analysis or explanation
+- Maintain academic rigor
+- Complexity matches specified difficulty level
+"""),
+    "long questions": ("LONG ANSWER QUESTIONS", """STRICT LONG QUESTION FORMATTING REQUIREMENTS:
+- Generate the requested number of UNIQUE Comprehensive Questions
+- Each question requires an in-depth, multi-part response
+
+LONG QUESTION FORMAT:
+Q[number]. [Complex, analytical question requiring comprehensive explanation]
+
+CRITICAL GUIDELINES:
+- Questions must demand critical thinking
+- Require synthesis of information from content
+- Encourage analytical and evaluative responses
+- Include potential for original insight
+- Ensure questions are NOT simply information regurgitation
+- Complexity significantly higher than short questions
+- Match specified difficulty level precisely
+"""),
+}
+
+_QUESTION_PROMPT = """{heading} GENERATION INSTRUCTIONS:
+
+{instructions}
+Context:
+- Source Content: {content}
+{topic_clause}- Difficulty Level: {difficulty}
+- Number of Questions: {num_questions}
+"""
+
+_PAPER_SECTION = """{heading} (section heading "### {section_heading}"):
+{instructions}
+"""
+
+_PAPER_PROMPT = """EXAM PAPER GENERATION INSTRUCTIONS:
+
+Generate every section below from the same source content.
+
+{sections}
+OUTPUT FORMAT:
+- Output the sections in this order, each starting with its heading on its own line: {section_headings}
+- Put each section's questions under its heading, in the format given for that section
+- Do not add any other headings
+
+Context:
+- Source Content: {content}
+{topic_clause}
+Section Settings:
+{settings}
+"""
 
 # Streamlit configuration
 st.set_page_config(
@@ -21,222 +185,558 @@ st.set_page_config(
     layout="wide"
 )
 
+@functools.lru_cache(maxsize=1)
+def _pdf_styles() -> dict:
+    """Build the paper's ReportLab paragraph styles once and reuse them."""
+    # ReportLab is only needed once a paper is generated
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    styles = getSampleStyleSheet()
+    heading_color = colors.HexColor("#2C3E50")
+
+    return {
+        # Title Style
+        "title": ParagraphStyle(
+            'TitleStyle',
+            parent=styles['Heading1'],
+            fontSize=22,
+            textColor=heading_color,
+            alignment=1,  # Center alignment
+            spaceAfter=12,
+            fontName='Helvetica-Bold'
+        ),
+        # Question Header Style
+        "header": ParagraphStyle(
+            'QuestionHeaderStyle',
+            parent=styles['Heading2'],
+            fontSize=16,
+            textColor=colors.HexColor("#34495E"),
+            spaceBefore=12,
+            spaceAfter=6,
+            fontName='Helvetica-Bold'
+        ),
+        # Normal Question Style
+        "question": ParagraphStyle(
+            'QuestionStyle',
+            parent=styles['BodyText'],
+            fontSize=12,
+            textColor=colors.black,
+            spaceBefore=6,
+            spaceAfter=6,
+            fontName='Helvetica'
+        ),
+        # Option Style (for MCQs)
+        "option": ParagraphStyle(
+            'OptionStyle',
+            parent=styles['BodyText'],
+            fontSize=11,
+            textColor=heading_color,
+            leftIndent=20,
+            leading=16,  # Options of one question share a paragraph
+            spaceBefore=3,
+            spaceAfter=3,
+            fontName='Helvetica'
+        ),
+        "body": styles['BodyText'],
+    }
+
+def _classify_line(line: str) -> tuple:
+    """Return the ``(kind, text)`` of one line of generated content.
+
+    ``kind`` names the _pdf_styles entry to use, or is None for a blank line.
+    """
+    # Paragraph parses its text as markup; escape model output so stray
+    # '<', '>' or '&' characters are printed instead of breaking the build
+    match = _LINE_RE.match(escape(line.strip()))
+    if match is None:
+        return None, None
+    return match.lastgroup, match.group(match.lastgroup)
+
 def generate_styled_pdf(title: str, content: str) -> BytesIO:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
-
-    # Create custom styles
-    styles = getSampleStyleSheet()
-    
-    # Title Style
-    title_style = ParagraphStyle(
-        'TitleStyle',
-        parent=styles['Heading1'],
-        fontSize=22,
-        textColor=colors.HexColor("#2C3E50"),
-        alignment=1,  # Center alignment
-        spaceAfter=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Question Header Style
-    question_header_style = ParagraphStyle(
-        'QuestionHeaderStyle',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor("#34495E"),
-        spaceBefore=12,
-        spaceAfter=6,
-        fontName='Helvetica-Bold'
-    )
-    
-    # Normal Question Style
-    question_style = ParagraphStyle(
-        'QuestionStyle',
-        parent=styles['BodyText'],
-        fontSize=12,
-        textColor=colors.black,
-        spaceBefore=6,
-        spaceAfter=6,
-        fontName='Helvetica'
-    )
-    
-    # Option Style (for MCQs)
-    option_style = ParagraphStyle(
-        'OptionStyle',
-        parent=styles['BodyText'],
-        fontSize=11,
-        textColor=colors.HexColor("#2C3E50"),
-        leftIndent=20,
-        spaceBefore=3,
-        spaceAfter=3,
-        fontName='Helvetica'
-    )
-    
-    # Prepare document elements
-    elements = []
-
-    # Add title
-    elements.append(Paragraph(title, title_style))
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # Process content with improved formatting
-    lines = content.split('\n')
-    for line in lines:
-        line = line.strip()
-        
-        # Identify and style different types of content
-        if line.startswith('###'):  # Section headers
-            header = line.replace('###', '').strip()
-            elements.append(Paragraph(header, question_header_style))
-        elif line.startswith('Q'):  # Questions
-            elements.append(Paragraph(line, question_style))
-        elif line.startswith(('A)', 'B)', 'C)', 'D)')):  # MCQ Options
-            elements.append(Paragraph(line, option_style))
-        elif line:  # Other content
-            elements.append(Paragraph(line, styles['BodyText']))
-        
-        # Add small spacing between elements
-        elements.append(Spacer(1, 0.1 * inch))
+    styles = _pdf_styles()
+
+    # Consecutive lines of the same kind share one Paragraph (joined with
+    # <br/>) and rely on the styles' spacing, which keeps the flowable count
+    # low on long papers; blank lines end a run.
+    lines = [_classify_line(line) for line in content.split('\n')]
+    elements = [
+        Paragraph(title, styles['title']),
+        Spacer(1, 0.25 * inch),
+        *(Paragraph('<br/>'.join(text for _, text in run), styles[kind])
+          for kind, run in groupby(lines, key=itemgetter(0)) if kind is not None),
+    ]
 
     # Build PDF
     doc.build(elements)
     buffer.seek(0)
     return buffer
 
+def select_context(text: str, topic: str = None, max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+    """Trim document text to the prompt token budget, favouring passages about the topic."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    topic_terms = {
+        term for term in _WORD_RE.findall(topic.lower())
+        if len(term) > 2 and term not in _STOPWORDS
+    } if topic else set()
+    if len(text) <= max_chars or not topic_terms:
+        return text[:max_chars]
+
+    # Only passages around a mention of a topic keyword are candidates
+    keyword_re = re.compile(r"\b(?:%s)\b" % "|".join(map(re.escape, topic_terms)), re.IGNORECASE)
+    windows = []  # (start, end) offsets into text
+    covered = 0
+    for match in keyword_re.finditer(text):
+        if match.start() < covered:
+            continue
+        start = max(match.start() - CONTEXT_WINDOW_CHARS // 2, covered)
+        covered = min(start + CONTEXT_WINDOW_CHARS, len(text))
+        windows.append((start, covered))
+    if not windows:
+        return text[:max_chars]
+
+    # Rank the candidate windows by TF-IDF of the topic terms. A term found
+    # in every window cannot tell them apart, so it gets no weight
+    window_terms = [Counter(_WORD_RE.findall(text[start:end].lower())) for start, end in windows]
+    window_counts = {term: sum(term in terms for terms in window_terms) for term in topic_terms}
+    idf = {term: math.log(len(windows) / count) if count else 0.0 for term, count in window_counts.items()}
+    scores = [
+        sum(terms[term] * idf[term] for term in topic_terms) / (sum(terms.values()) or 1)
+        for terms in window_terms
+    ]
+
+    # Keep the best windows that fit, in document order. If there are more
+    # than fit and none stands out, the topic is everywhere in the document,
+    # so it is not worth reordering the text for it
+    top_k = max(1, max_chars // CONTEXT_WINDOW_CHARS)
+    if len(windows) > top_k and not any(scores):
+        return text[:max_chars]
+    best = sorted(sorted(range(len(windows)), key=scores.__getitem__, reverse=True)[:top_k])
+    spans = [list(windows[i]) for i in best]
+
+    # Widen the kept windows into their surrounding text until the budget is
+    # used up, so a focused prompt never carries less context than an
+    # unfocused one
+    spare = max_chars - sum(end - start for start, end in spans) - (len(spans) - 1)
+    while spare > 0:
+        share = max(1, spare // (2 * len(spans)))
+        grown = 0
+        for i, span in enumerate(spans):
+            lower = spans[i - 1][1] if i else 0
+            upper = spans[i + 1][0] if i + 1 < len(spans) else len(text)
+            left = min(share, span[0] - lower, spare)
+            span[0] -= left
+            spare -= left
+            right = min(share, upper - span[1], spare)
+            span[1] += right
+            spare -= right
+            grown += left + right
+        if not grown:
+            break
+
+    # Windows that have grown into each other are joined back together
+    merged = [spans[0]]
+    for start, end in spans[1:]:
+        if start == merged[-1][1]:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return "\n".join(text[start:end] for start, end in merged)[:max_chars]
+
+def _join_limited(parts, limit: int = MAX_EXTRACT_CHARS) -> str:
+    """Join lines of text, consuming ``parts`` only until ``limit`` characters are collected."""
+    collected = []
+    total = 0
+    for part in parts:
+        collected.append(part)
+        total += len(part) + 1
+        if total >= limit:
+            break
+    return "\n".join(collected)[:limit]
+
+# Cached helpers; Streamlit reruns the whole script on every interaction
+@st.cache_data(show_spinner=False)
+def _extract_text(digest: str, _file, mime: str, first_page: int = 1, last_page: int = None) -> str:
+    """Extract text from an uploaded document; cached on digest, MIME type and page range.
+
+    ``digest`` is the BLAKE2b fingerprint of the upload, so Streamlit hashes
+    a short string instead of the whole file, and cache hits never read
+    ``_file`` at all.
+    ``first_page`` and ``last_page`` (1-based, inclusive) limit which PDF
+    pages are parsed; other formats are always read in full.
+    """
+    file_bytes = _file.getvalue()
+
+    # Parser backends are imported by the branch that needs them, so app
+    # start-up does not pay for libraries no upload has asked for yet
+    try:
+        if mime == "application/pdf":
+            # Poppler's native pdftotext is the fastest extractor when installed
+            pdftotext = shutil.which("pdftotext")
+            if pdftotext:
+                command = [pdftotext, "-q", "-enc", "UTF-8", "-f", str(first_page)]
+                if last_page:
+                    command += ["-l", str(last_page)]
+                try:
+                    result = subprocess.run(command + ["-", "-"], input=file_bytes, capture_output=True, check=True, timeout=120)
+                    text = result.stdout.decode("utf-8", "ignore")
+                    if text.strip():
+                        return text[:MAX_EXTRACT_CHARS]
+                except (OSError, subprocess.SubprocessError):
+                    pass  # Fall through to MuPDF
+
+            import pymupdf
+            try:
+                with pymupdf.open(stream=file_bytes, filetype="pdf") as pdf:
+                    stop = min(last_page or pdf.page_count, pdf.page_count)
+                    text = _join_limited(pdf[number].get_text("text") for number in range(first_page - 1, stop))
+                if text.strip():
+                    return text
+            except RuntimeError:
+                pass  # MuPDF refuses some malformed files
+
+            # Fall back to pdfplumber when MuPDF cannot open the file or finds
+            # no text layer; its pdfminer parser copes with some of those
+            import pdfplumber
+            with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+                stop = min(last_page or len(pdf.pages), len(pdf.pages))
+                return _join_limited(pdf.pages[number].extract_text() or "" for number in range(first_page - 1, stop))
+        elif mime == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+            from lxml import etree
+
+            # Read the text runs straight from the document XML rather than
+            # building python-docx wrappers for every paragraph and run
+            with zipfile.ZipFile(BytesIO(file_bytes)) as docx:
+                body = etree.fromstring(docx.read("word/document.xml"), etree.XMLParser(resolve_entities=False))
+            # Text boxes are stored twice (mc:Choice and mc:Fallback) inside
+            # the paragraph that anchors them, so skip w:txbxContent entirely,
+            # as python-docx does
+            namespaces = {"w": _W[1:-1]}
+            run_text = etree.XPath(
+                ".//w:r/*[self::w:t or self::w:tab or self::w:br or self::w:cr][not(ancestor::w:txbxContent)]",
+                namespaces=namespaces
+            )
+            paragraphs = body.xpath("//w:p[not(ancestor::w:txbxContent)]", namespaces=namespaces)
+            return _join_limited(
+                "".join((node.text or "") if node.tag == _W + "t" else _DOCX_RUN_BREAKS[node.tag] for node in run_text(paragraph))
+                for paragraph in paragraphs
+            )
+        elif mime == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
+            from pptx import Presentation
+            from pptx.oxml.ns import qn
+
+            # Walk each slide's XML for DrawingML paragraphs instead of
+            # building a python-pptx object for every shape; this also picks
+            # up text inside tables and grouped shapes
+            ppt = Presentation(BytesIO(file_bytes))
+            lines = (
+                "".join(
+                    (node.text or "") if node.tag == qn("a:t") else "\n"
+                    for node in paragraph.iter(qn("a:t"), qn("a:br"))
+                )
+                for slide in ppt.slides for paragraph in slide.element.iter(qn("a:p"))
+            )
+            return _join_limited(line for line in lines if line)
+        elif mime == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
+            from openpyxl import load_workbook
+
+            # Stream rows from a read-only workbook into tab-separated text;
+            # the csv writer quotes cells that contain tabs or line breaks
+            workbook = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+            try:
+                buffer = StringIO()
+                writer = csv.writer(buffer, delimiter="\t", lineterminator="\n")
+                for row in (row for sheet in workbook.worksheets for row in sheet.iter_rows(values_only=True)):
+                    writer.writerow(row)
+                    if buffer.tell() >= MAX_EXTRACT_CHARS:
+                        break
+                return buffer.getvalue()[:MAX_EXTRACT_CHARS]
+            finally:
+                workbook.close()
+        elif mime == "text/plain":
+            try:
+                return file_bytes.decode("utf-8-sig")[:MAX_EXTRACT_CHARS]
+            except UnicodeDecodeError:
+                pass
+            # Not UTF-8: detect the encoding instead of rejecting the upload
+            try:
+                from charset_normalizer import from_bytes
+            except ImportError:
+                return file_bytes.decode("utf-8", "ignore")[:MAX_EXTRACT_CHARS]
+            best = from_bytes(file_bytes).best()
+            text = str(best) if best is not None else file_bytes.decode("utf-8", "ignore")
+            return text[:MAX_EXTRACT_CHARS]
+        else:
+            return "Unsupported file format"
+    except Exception as e:
+        return f"Error processing file: {str(e)}"
+
+@st.cache_data(show_spinner=False, ttl=RESPONSE_CACHE_TTL)
+def _request_completion(_client: Groq, _on_delta, prompt: str, max_tokens: int = None, model: str = MODEL, temperature: float = TEMPERATURE, top_p: float = TOP_P) -> str:
+    """Stream a question-generation prompt through Groq; cached on prompt and sampling settings.
+
+    Each text delta is passed to ``_on_delta`` as it arrives. Cache hits
+    return the full text without calling it. Failed requests raise, so
+    transient API errors are never cached.
+    """
+    stream = _client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stream=True
+    )
+    parts = []
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content or ""
+        if delta:
+            parts.append(delta)
+            if _on_delta is not None:
+                _on_delta(delta)
+    return "".join(parts)
+
+def _load_encoder():
+    """Load the sentence encoder for the semantic cache, if it is installed."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+@st.cache_resource(show_spinner=False)
+def _encoder_future():
+    """Start loading the sentence encoder in the background, once per process.
+
+    The first load may download the model, so nothing waits on it; the
+    semantic cache stays inactive until the returned future is done.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(_load_encoder)
+    executor.shutdown(wait=False)
+    return future
+
+class SemanticCache:
+    """Reuse earlier responses for near-identical generation requests.
+
+    Requests only match when they target the same document and ask for the
+    same question types, counts and difficulties; only the topic wording is
+    compared by embedding similarity. Entries expire after ``ttl`` seconds,
+    like the exact response cache, and at most ``max_entries`` are kept.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries = deque(maxlen=max_entries)  # (key, embedding, response, expires_at), oldest first
+        self._lock = threading.Lock()
+        self._encoder = _encoder_future()
+
+    def _embed(self, text: str):
+        # Never block generation on the model load
+        if not self._encoder.done() or self._encoder.exception() is not None:
+            return None
+        encoder = self._encoder.result()
+        if encoder is None:
+            return None
+        return encoder.encode(text, normalize_embeddings=True)
+
+    def lookup(self, key: tuple, text: str):
+        """Return the closest cached response above the threshold, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entries = [
+                (embedding, response)
+                for entry_key, embedding, response, expires_at in self._entries
+                if entry_key == key and expires_at > now
+            ]
+        if not entries:
+            return None
+        query = self._embed(text)
+        if query is None:
+            return None
+        # Installed alongside sentence-transformers, like the encoder itself
+        import numpy as np
+
+        scores = np.stack([embedding for embedding, _ in entries]) @ query
+        best = int(np.argmax(scores))
+        return entries[best][1] if scores[best] >= self.threshold else None
+
+    def insert(self, key: tuple, text: str, response: str):
+        embedding = self._embed(text)
+        if embedding is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # Every entry shares one TTL, so the expired ones are the oldest
+            while self._entries and self._entries[0][3] <= now:
+                self._entries.popleft()
+            self._entries.append((key, embedding, response, now + self.ttl))
+
+@st.cache_resource(show_spinner=False)
+def get_groq_client(api_key: str) -> Groq:
+    """Return a shared Groq client so its HTTP connections are kept alive."""
+    return Groq(api_key=api_key)
+
 # Document processor class
 class DocumentProcessor:
-    def __init__(self, api_key: str):
-        self.client = Groq(api_key=api_key)
+    def __init__(self, client: Groq, semantic_cache: SemanticCache = None):
+        self.client = client
+        self.semantic_cache = semantic_cache
+        self._digests = {}  # upload file_id -> BLAKE2b hex digest
 
-    def extract_text(self, file) -> str:
+    def extract_text(self, file, first_page: int = 1, last_page: int = None) -> str:
         """Extract text from different document types."""
-        try:
-            if file.type == "application/pdf":
-                with pdfplumber.open(file) as pdf:
-                    return "\n".join(page.extract_text() or "" for page in pdf.pages)
-            elif file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                doc = Document(file)
-                return "\n".join(paragraph.text for paragraph in doc.paragraphs)
-            elif file.type == "application/vnd.openxmlformats-officedocument.presentationml.presentation":
-                ppt = Presentation(file)
-                return "\n".join(
-                    shape.text for slide in ppt.slides for shape in slide.shapes if hasattr(shape, "text")
-                )
-            elif file.type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
-                df = pd.read_excel(file)
-                return df.to_string(index=False)
-            elif file.type == "text/plain":
-                return file.getvalue().decode("utf-8")
-            else:
-                return "Unsupported file format"
-        except Exception as e:
-            return f"Error processing file: {str(e)}"
-
-    def generate_questions(self, content: str, question_type: str, num_questions: int, difficulty: str, specific_topic: str = None) -> str:
-        """Generate questions based on content with type-specific prompts."""
+        # Uploads keep their file_id across reruns, so each one is read and
+        # fingerprinted once; after that the cached text is found by digest
+        digest = self._digests.get(file.file_id)
+        if digest is None:
+            digest = self._digests[file.file_id] = hashlib.blake2b(file.getvalue()).hexdigest()
+        # Only PDFs honour the page range; keep it out of other formats'
+        # cache keys so changing it does not re-parse them
+        if file.type != "application/pdf":
+            first_page, last_page = 1, None
+        return _extract_text(digest, file, file.type, first_page, last_page)
+
+    def _complete(self, cache_key: tuple, specific_topic: str, on_delta, prompt: str, max_tokens: int) -> str:
+        """Run a prompt through Groq, answering from the semantic cache when possible."""
+        cache_text = f"Topic: {specific_topic or 'entire document'}"
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.lookup(cache_key, cache_text)
+            if cached is not None:
+                return cached
+
+        response = _request_completion(self.client, on_delta, prompt, max_tokens)
+        if self.semantic_cache is not None:
+            self.semantic_cache.insert(cache_key, cache_text, response)
+        return response
+
+    def generate_questions(self, content: str, question_type: str, num_questions: int, difficulty: str, specific_topic: str = None, on_delta=None) -> str:
+        """Generate questions based on content with type-specific prompts.
+
+        Text deltas are passed to ``on_delta`` while the response streams in;
+        the complete text is returned either way.
+        """
         if not content or content.strip() == "":
             return "No content provided for question generation."
 
-        # Separate prompts for each question type
-        if question_type == "multiple choice questions":
-            prompt = f"""
-            MULTIPLE CHOICE QUESTIONS (MCQs) GENERATION INSTRUCTIONS:
-
-            Context:
-            - Source Content: {content[:4000]}
-            {'- Focus Topic: ' + specific_topic if specific_topic else ''}
-            - Difficulty Level: {difficulty}
-
-            STRICT MCQ FORMATTING REQUIREMENTS:
-            - Generate {num_questions} UNIQUE Multiple Choice Questions
-            - Each question MUST have EXACTLY 4 options
-            
-            MCQ FORMAT:
-            Q[number]. [Precise, knowledge-testing question]
-            
-            Options (EXACTLY 4, precisely formatted and new line after each option):
-            A) [Option 1 then start a new line]
-            B) [Option 2 then start a new line]
-            C) [Option 3 then start a new line]
-            D) [Option 4 then start a new line]
-            
-       
-
-            CRITICAL GUIDELINES:
-            - Derive questions ONLY from provided content
-            - Ensure NO overlap between questions
-            - Options must be academically credible
-            - CORRECT answer must be unambiguously right
-            - Maintain academic language
-            - Complexity matches specified difficulty level
-            """
-
-        elif question_type == "short questions":
-            prompt = f"""
-            SHORT ANSWER QUESTIONS GENERATION INSTRUCTIONS:
-
-            Context:
-            - Source Content: {content[:4000]}
-            {'- Focus Topic: ' + specific_topic if specific_topic else ''}
-            - Difficulty Level: {difficulty}
-
-            STRICT SHORT QUESTION FORMATTING REQUIREMENTS:
-            - Generate {num_questions} UNIQUE Short Answer Questions
-            - Each question requires a focused, concise response (2-3 sentences)
-            
-            SHORT QUESTION FORMAT:
-            Q[number]. [Precise, concept-testing question requiring brief, specific answer]
-
-            CRITICAL GUIDELINES:
-            - Questions must be answerable using ONLY the provided content
-            - Focus on key concepts, definitions, explanations
-            - Avoid yes/no questions
-            - Ensure questions test understanding, not mere recall
-            - Each question should require analysis or explanation
-            - Maintain academic rigor
-            - Complexity matches specified difficulty level
-            """
-
-        elif question_type == "long questions":
-            prompt = f"""
-            LONG ANSWER QUESTIONS GENERATION INSTRUCTIONS:
-
-            Context:
-            - Source Content: {content[:4000]}
-            {'- Focus Topic: ' + specific_topic if specific_topic else ''}
-            - Difficulty Level: {difficulty}
-
-            STRICT LONG QUESTION FORMATTING REQUIREMENTS:
-            - Generate {num_questions} UNIQUE Comprehensive Questions
-            - Each question requires an in-depth, multi-part response
-            
-            LONG QUESTION FORMAT:
-            Q[number]. [Complex, analytical question requiring comprehensive explanation]
+        heading, instructions = QUESTION_PROMPTS[question_type]
+        prompt = _QUESTION_PROMPT.format(
+            heading=heading,
+            instructions=instructions,
+            content=content,
+            topic_clause=f"- Focus Topic: {specific_topic}\n" if specific_topic else "",
+            difficulty=difficulty,
+            num_questions=num_questions
+        )
+
+        # Near-duplicate requests on the same document reuse an earlier answer
+        cache_key = (hashlib.blake2b(content.encode("utf-8")).hexdigest(), ((question_type, num_questions, difficulty),))
+        try:
+            max_tokens = min(num_questions * TOKENS_PER_QUESTION[question_type], reply_token_limit(prompt))
+            return self._complete(cache_key, specific_topic, on_delta, prompt, max_tokens)
+        except Exception as e:
+            return f"{GENERATION_ERROR}: {str(e)}"
 
+    def generate_paper(self, content: str, question_settings: dict, specific_topic: str = None, on_delta=None) -> str:
+        """Generate several question types with a single Groq call.
 
-            CRITICAL GUIDELINES:
-            - Questions must demand critical thinking
-            - Require synthesis of information from content
-            - Encourage analytical and evaluative responses
-            - Include potential for original insight
-            - Ensure questions are NOT simply information regurgitation
-            - Complexity significantly higher than short questions
-            - Match specified difficulty level precisely
-            """
+        ``question_settings`` maps question type names to their
+        ``num_questions`` and ``difficulty``. The reply holds one
+        ``### <heading>`` section per type (see split_paper) and streams to
+        ``on_delta`` like generate_questions.
+        """
+        if not content or content.strip() == "":
+            return "No content provided for question generation."
 
+        prompt, max_tokens = build_paper_prompt(content, question_settings, specific_topic)
+        max_tokens = min(max_tokens, reply_token_limit(prompt))
+        cache_key = (
+            hashlib.blake2b(content.encode("utf-8")).hexdigest(),
+            tuple((question_type, settings["num_questions"], settings["difficulty"]) for question_type, settings in question_settings.items())
+        )
         try:
-            response = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": "You are a precise, academic exam question generator. Dont give the raw heading and data and give point to point data only in a good format and alignment"},
-                    {"role": "user", "content": prompt}
-                ],
-                model="gemma2-9b-it",
-                temperature=0.7  # Slight randomness to prevent repetition
-            )
-            return response.choices[0].message.content
+            return self._complete(cache_key, specific_topic, on_delta, prompt, max_tokens)
         except Exception as e:
-            return f"Error generating questions: {str(e)}"
+            return f"{GENERATION_ERROR}: {str(e)}"
+
+def reply_token_limit(prompt: str) -> int:
+    """Estimate how many reply tokens fit in the model's window after ``prompt``."""
+    return MODEL_CONTEXT_TOKENS - (len(SYSTEM_PROMPT) + len(prompt)) // CHARS_PER_TOKEN
+
+def build_paper_prompt(content: str, question_settings: dict, specific_topic: str = None) -> tuple:
+    """Return the generate_paper prompt and the reply tokens it needs."""
+    sections = []
+    settings_lines = []
+    max_tokens = 0
+    for question_type, settings in question_settings.items():
+        heading, instructions = QUESTION_PROMPTS[question_type]
+        max_tokens += settings["num_questions"] * TOKENS_PER_QUESTION[question_type] + PAPER_SECTION_TOKENS
+        sections.append(_PAPER_SECTION.format(heading=heading, section_heading=PAPER_SECTION_HEADINGS[question_type], instructions=instructions))
+        settings_lines.append(f"- {heading}: {settings['num_questions']} questions, {settings['difficulty']} difficulty")
+    prompt = _PAPER_PROMPT.format(
+        sections="\n".join(sections),
+        section_headings=", ".join(f'"### {PAPER_SECTION_HEADINGS[question_type]}"' for question_type in question_settings),
+        content=content,
+        topic_clause=f"- Focus Topic: {specific_topic}\n" if specific_topic else "",
+        settings="\n".join(settings_lines)
+    )
+    return prompt, max_tokens
+
+def split_paper(text: str, question_types) -> dict:
+    """Split a generate_paper reply into questions per type.
+
+    Returns None unless every requested type has a non-empty section.
+    """
+    # Accept the section heading or the label the prompt gives the section,
+    # optionally numbered ("Section 1: ...") or followed by "(MCQs)" etc.
+    headings = {}
+    for question_type in question_types:
+        for heading in (PAPER_SECTION_HEADINGS[question_type], QUESTION_PROMPTS[question_type][0]):
+            headings[re.sub(r"\s*\(.*?\)", "", heading).lower()] = question_type
+    heading_re = re.compile(
+        r"^[\s#*]*(?:(?:section|part)\s+\w+\s*[:.)\-\u2013]\s*)?(%s)\s*(?:\([^)\n]*\))?[\s#*:]*$"
+        % "|".join(map(re.escape, headings)),
+        re.IGNORECASE | re.MULTILINE
+    )
+    matches = list(heading_re.finditer(text))
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        sections[headings[match.group(1).lower()]] = text[match.end():end].strip()
+    if not all(sections.get(question_type) for question_type in question_types):
+        return None
+    return sections
+
+def _generate_into(pieces: Queue, generate, **kwargs) -> str:
+    """Run a DocumentProcessor generate method, pushing streamed text onto ``pieces``.
+
+    A trailing ``None`` marks the end of the stream.
+    """
+    try:
+        return generate(**kwargs, on_delta=pieces.put)
+    finally:
+        pieces.put(None)
+
+def _stream_section(pieces: Queue, future):
+    """Yield a section's text as it arrives from its worker thread."""
+    streamed = []
+    while (piece := pieces.get()) is not None:
+        streamed.append(piece)
+        yield piece
+    # Cached answers and error messages are returned without streaming
+    result = future.result()
+    if result != "".join(streamed):
+        yield f"\n\n{result}" if streamed else result
 
 # Main application remains the same as in previous version
 def main():
@@ -257,14 +757,35 @@ def main():
     specific_topic = st.text_input("🎯 Specify a Specific Topic (Optional)", 
                                    help="Enter a topic to focus the exam questions. Leave blank to use entire document content.")
 
+    # Page range input, shown only when a PDF is uploaded
+    first_page, last_page = 1, None
+    if uploaded_files and any(file.type == "application/pdf" for file in uploaded_files):
+        first_page = st.number_input("📄 First PDF Page", min_value=1, value=1, step=1, key="first_page",
+                                     help="Skip the pages before this one in every uploaded PDF.")
+        last_page = st.number_input("📄 Last PDF Page (Optional)", min_value=1, value=None, step=1, key="last_page",
+                                    help="Stop reading PDFs after this page. Leave blank to read to the end.")
+        if last_page is not None and last_page < first_page:
+            st.warning(f"The last page is before the first page; reading only page {first_page}.")
+            last_page = first_page
+
     # Proceed only if files are uploaded
     if uploaded_files:
         try:
-            # Initialize processor
-            processor = DocumentProcessor(api_key)
-
-            # Extract content from uploaded files
-            combined_text = "\n\n".join(processor.extract_text(file) for file in uploaded_files)
+            # Initialize the processor once per session, rebuilding it only
+            # if the API key (and so the shared client) changes
+            client = get_groq_client(api_key)
+            processor = st.session_state.get("processor")
+            if processor is None or processor.client is not client:
+                if "sem_cache" not in st.session_state:
+                    st.session_state.sem_cache = SemanticCache()
+                processor = DocumentProcessor(client, st.session_state.sem_cache)
+                st.session_state.processor = processor
+
+            # Extract content from uploaded files in parallel; the parsers do
+            # most of their work in native code, so threads overlap well
+            with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as executor:
+                texts = list(executor.map(lambda file: processor.extract_text(file, first_page, last_page), uploaded_files))
+            combined_text = "\n\n".join(texts)
             
             if not combined_text or combined_text.strip() == "":
                 st.error("No text could be extracted from the uploaded documents.")
@@ -304,36 +825,91 @@ def main():
                     st.warning("Please select at least one question type.")
                     return
 
-                with st.spinner("Generating exam paper..."):
-                    paper_content = []
-
-                    # Generate questions for each selected type
-                    for q_type, settings in question_settings.items():
-                        question_type_name = {"mcq": "Multiple Choice Questions", "short": "Short Questions", "long": "Long Questions"}
-                        questions = processor.generate_questions(
-                            content=combined_text,
-                            question_type=question_type_name[q_type].lower(),
-                            num_questions=settings["num_questions"],
-                            difficulty=settings["difficulty"],
+                question_type_name = {"mcq": "Multiple Choice Questions", "short": "Short Questions", "long": "Long Questions"}
+
+                # Trim the documents to the prompt budget once for all question
+                # types, and only when a paper is requested rather than on
+                # every widget change
+                llm_context = select_context(combined_text, specific_topic)
+
+                st.write("### Generated Exam Paper")
+                with ThreadPoolExecutor(max_workers=len(question_settings)) as executor:
+                    # Ask for all selected types in one call, so the shared
+                    # document context is only sent and decoded once. The
+                    # reply streams in with its own section headings. Papers
+                    # too long for one reply are generated per type instead.
+                    paper = None
+                    paper_settings = {
+                        question_type_name[q_type].lower(): settings
+                        for q_type, settings in question_settings.items()
+                    }
+                    paper_prompt, paper_tokens = build_paper_prompt(llm_context, paper_settings, specific_topic)
+                    if len(question_settings) > 1 and paper_tokens <= reply_token_limit(paper_prompt):
+                        pieces = Queue()
+                        future = executor.submit(
+                            _generate_into,
+                            pieces,
+                            processor.generate_paper,
+                            content=llm_context,
+                            question_settings=paper_settings,
                             specific_topic=specific_topic
                         )
-                        paper_content.append(f"### {question_type_name[q_type]}\n\n{questions}")
-
-                    # Combine all generated questions
-                    combined_paper = "\n\n".join(paper_content)
-
-                    # Display the generated questions
-                    st.write("### Generated Exam Paper")
-                    st.write(combined_paper)
-
-                    # Provide download option
-                    pdf_buffer = generate_styled_pdf("Exam Paper", combined_paper)
-                    st.download_button(
-                        label="📥 Download Paper as PDF",
-                        data=pdf_buffer,
-                        file_name="exam_paper.pdf",
-                        mime="application/pdf"
-                    )
+                        placeholder = st.empty()
+                        with placeholder.container():
+                            paper_text = st.write_stream(_stream_section(pieces, future))
+                        if paper_text.startswith(GENERATION_ERROR):
+                            # Per-type requests would fail the same way
+                            placeholder.empty()
+                            st.error(paper_text)
+                            return
+                        paper = split_paper(paper_text, [question_type_name[q_type].lower() for q_type in question_settings])
+                        if paper is None:
+                            placeholder.empty()  # Unusable reply; regenerate per type below
+
+                    if paper is not None:
+                        paper_content = [
+                            f"### {question_type_name[q_type]}\n\n{paper[question_type_name[q_type].lower()]}"
+                            for q_type in question_settings
+                        ]
+                    else:
+                        # Otherwise (or if the combined reply was unusable)
+                        # generate each type concurrently; the LLM calls are
+                        # independent, so total latency is the slowest call
+                        # rather than their sum
+                        sections = {}
+                        for q_type, settings in question_settings.items():
+                            pieces = Queue()
+                            future = executor.submit(
+                                _generate_into,
+                                pieces,
+                                processor.generate_questions,
+                                content=llm_context,
+                                question_type=question_type_name[q_type].lower(),
+                                num_questions=settings["num_questions"],
+                                difficulty=settings["difficulty"],
+                                specific_topic=specific_topic
+                            )
+                            sections[q_type] = _stream_section(pieces, future)
+
+                        # Display the generated questions as they stream in,
+                        # in the order the types were selected
+                        paper_content = []
+                        for q_type, section in sections.items():
+                            st.markdown(f"### {question_type_name[q_type]}")
+                            questions = st.write_stream(section)
+                            paper_content.append(f"### {question_type_name[q_type]}\n\n{questions}")
+
+                # Combine all generated questions
+                combined_paper = "\n\n".join(paper_content)
+
+                # Provide download option
+                pdf_buffer = generate_styled_pdf("Exam Paper", combined_paper)
+                st.download_button(
+                    label="📥 Download Paper as PDF",
+                    data=pdf_buffer,
+                    file_name="exam_paper.pdf",
+                    mime="application/pdf"
+                )
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
 